@@ -94,19 +94,23 @@ class FmIndex:
 
         n = self.n
 
+        # bind the hot lookups to locals for the loop below
+        f = self.bwt.f
+        rank = self.bwt.rank
+
         i = len(sample) - 1
         c = sample[i]
-        sp = self.bwt.f[c] - 1
-        ep = self.bwt.f[self.bwt.next_chars[c]] - 1
+        sp = f[c] - 1
+        ep = f[self.bwt.next_chars[c]] - 1
 
         while ep > sp and i >= 1:
             c = sample[i - 1]
 
-            rank_sp = self.bwt.rank(c, sp)
-            rank_ep = self.bwt.rank(c, ep)
+            rank_sp = rank(c, sp)
+            rank_ep = rank(c, ep)
 
-            sp = self.bwt.f[c] + rank_sp - 1
-            ep = self.bwt.f[c] + rank_ep - 1
+            sp = f[c] + rank_sp - 1
+            ep = f[c] + rank_ep - 1
 
             i = i - 1
 
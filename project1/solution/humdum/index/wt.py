@@ -1,14 +1,191 @@
 
 from typing import List, Tuple
-from bitarray import frozenbitarray
 import numpy as np
 from humdum.utils import minidict
 
+try:
+    from numba import njit
+except ImportError:
+    # no-op fallback when numba is unavailable
+    def njit(*args, **kwargs):
+        if args and callable(args[0]):
+            return args[0]
+        return (lambda f: f)
+
 
 # How wavelet trees work by Ben Langmead
 # https://www.youtube.com/watch?v=JszVzStky1E&t=21s
 # https://www.youtube.com/watch?v=5oSakiWVC-w&t=2s
 
+# number of set bits for every possible byte value (used for rank queries)
+_POPCOUNT8 = np.unpackbits(np.arange(256, dtype=np.uint8).reshape(-1, 1), axis=1).sum(axis=1).astype(np.int64)
+
+# The tree shape is fixed for the {A, C, G, N, T, $} alphabet (see the diagram
+# in WaveletTree.__init__). It is encoded as typed arrays so that the query
+# kernels below can run in numba nopython mode:
+# child of internal node (-1 = the child is a leaf) ...
+_LEFT_CHILD = np.array([1, -1, 3, -1, -1], dtype=np.int8)
+_RIGHT_CHILD = np.array([2, -1, 4, -1, -1], dtype=np.int8)
+# ... and the character of that leaf
+_LEAF_LEFT = np.array([0, ord('N'), 0, ord('C'), ord('T')], dtype=np.uint8)
+_LEAF_RIGHT = np.array([0, ord('A'), 0, ord('G'), ord('$')], dtype=np.uint8)
+
+# per-character root-to-leaf code paths (0 = left, 1 = right), row index by character byte
+_CHAR_ROW = np.full(256, -1, dtype=np.int8)
+for (_row, _char) in enumerate('NACGT$'):
+    _CHAR_ROW[ord(_char)] = _row
+_CODES = np.array([[0, 0, 0], [0, 1, 0], [1, 0, 0], [1, 0, 1], [1, 1, 0], [1, 1, 1]], dtype=np.int8)
+_CODE_LEN = np.array([2, 2, 3, 3, 3, 3], dtype=np.int8)
+
+# integer encoding of the alphabet for the DC3 suffix array construction,
+# indexed by character byte
+_DC3_ENC = np.zeros(256, dtype=np.int32)
+for (_i, _char) in enumerate('$ACGNT'):
+    _DC3_ENC[ord(_char)] = _i + 1
+
+
+@njit(cache=True)
+def _get_bit(packed: np.ndarray, i: int) -> int:
+    """
+    Returns bit i of a bitvector given by its packed (MSB-first) byte view
+    """
+
+    return (packed[i >> 3] >> (7 - (i & 7))) & 1
+
+
+@njit(cache=True)
+def _popcount_kernel(packed: np.ndarray, base: int, lo: int, hi: int) -> int:
+    """
+    Returns the number of set bits in positions [lo, hi] (inclusive) of the
+    bitvector starting at byte offset 'base' of the packed buffer
+    """
+
+    if hi < lo:
+        return 0
+
+    first = lo >> 3
+    last = hi >> 3
+
+    head_mask = 0xFF >> (lo & 7)
+    tail_mask = (0xFF << (7 - (hi & 7))) & 0xFF
+
+    if first == last:
+        return _POPCOUNT8[packed[base + first] & head_mask & tail_mask]
+
+    rank = _POPCOUNT8[packed[base + first] & head_mask] + _POPCOUNT8[packed[base + last] & tail_mask]
+
+    for j in range(first + 1, last):
+        rank += _POPCOUNT8[packed[base + j]]
+
+    return rank
+
+
+@njit(cache=True)
+def _rank_ones_kernel(packed, bit_starts, buckets, bucket_starts, bucket_steps, index, node):
+    """
+    Returns the number of set bits up to the index [0,index] at the given node,
+    together with the bit at the index itself (so callers need not re-fetch it)
+    """
+
+    base = bit_starts[node]
+    step = bucket_steps[node]
+
+    bucket_index = index // step
+    rank = _popcount_kernel(packed, base, bucket_index * step + 1, index)
+    rank += buckets[bucket_starts[node] + bucket_index]
+
+    bit = (packed[base + (index >> 3)] >> (7 - (index & 7))) & 1
+
+    return rank, bit
+
+
+@njit(cache=True)
+def _rank_bit_node_kernel(packed, bit_starts, buckets, bucket_starts, bucket_steps, index, node):
+    """
+    Returns the rank of the bit up to the index [0,index] at the given node
+    """
+
+    (rank, bit) = _rank_ones_kernel(packed, bit_starts, buckets, bucket_starts, bucket_steps, index, node)
+
+    if bit == 1:
+        return rank
+    else:
+        return index + 1 - rank
+
+
+@njit(cache=True)
+def _rank_kernel(packed, bit_starts, buckets, bucket_starts, bucket_steps, row, index):
+    """
+    Returns the rank of the character (given by its row in the code table)
+    up to the index [0,index]
+    """
+
+    curr_node = 0
+    curr_index = index
+    rank = 0
+
+    for depth in range(_CODE_LEN[row]):
+        code = _CODES[row, depth]
+
+        # the ones-rank determines the zeros-rank, so the rank towards either
+        # child is known without fetching the bit at curr_index a second time
+        (ones, bit) = _rank_ones_kernel(packed, bit_starts, buckets, bucket_starts, bucket_steps,
+                                        curr_index, curr_node)
+
+        rank = ones if code else (curr_index + 1 - ones)
+
+        if rank == 0:
+            return 0
+
+        curr_index = rank - 1
+
+        curr_node = _RIGHT_CHILD[curr_node] if code else _LEFT_CHILD[curr_node]
+
+    return rank
+
+
+@njit(cache=True)
+def _access_kernel(packed, bit_starts, buckets, bucket_starts, bucket_steps, index, node):
+    """
+    Returns the character byte of the burrows wheeler transformation at the given index
+    """
+
+    curr_node = node
+    curr_index = index
+
+    while True:
+        (ones, bit) = _rank_ones_kernel(packed, bit_starts, buckets, bucket_starts, bucket_steps,
+                                        curr_index, curr_node)
+
+        child = _RIGHT_CHILD[curr_node] if bit else _LEFT_CHILD[curr_node]
+
+        if child < 0:
+            return _LEAF_RIGHT[curr_node] if bit else _LEAF_LEFT[curr_node]
+
+        curr_index = (ones if bit else (curr_index + 1 - ones)) - 1
+        curr_node = child
+
+
+@njit(cache=True)
+def _sa_walk_kernel(packed, bit_starts, buckets, bucket_starts, bucket_steps, bitvector, f_lut, index):
+    """
+    Walks the LF-mapping from 'index' until a stored row of the compressed
+    suffix array is hit; returns that row and the number of steps taken
+    """
+
+    next_row = index
+    counter = 0
+
+    while ((bitvector[next_row >> 3] >> (7 - (next_row & 7))) & 1) != 1:
+        char = _access_kernel(packed, bit_starts, buckets, bucket_starts, bucket_steps, next_row, 0)
+        rank = _rank_kernel(packed, bit_starts, buckets, bucket_starts, bucket_steps,
+                            _CHAR_ROW[char], next_row)
+
+        next_row = rank + f_lut[char] - 1
+        counter += 1
+
+    return next_row, counter
+
 class WaveletTree:
     """
     Generates a Suffix Array (SA), first column of Suffix Matrix (f)
@@ -29,6 +206,8 @@ class WaveletTree:
     - KaerkkaeinenSanders (recommended):
         Runtime: O(n)
         Space: O(n)
+        Delegates to the compiled libdivsufsort (via the optional package 'pydivsufsort')
+        when available; falls back to the pure-Python implementation otherwise.
     - ManberMyers:
         Runtime: O(nlog(n) )
         Space: O(n)
@@ -84,17 +263,43 @@ class WaveletTree:
         # compressed first column of burrows wheeler matrix (e.g. cumulative frequencies of characters)
         self.f = self._shifts_f(reference_genome)
 
-        # Bitvector of nodes, an array which stores the ranks of the bits with corresponding step size
-        self.bits, self.bucket_bits, self.bucket_step_bits = self.create_bit_vecs(bwt)
-
-        # Structure [Parent, Me, Left_child, Right_Child]
-        self.meta = [[None, 0, 1, 2], [0, 1, 'N', 'A'], [0, 2, 3, 4], [2, 3, 'C', 'G'], [2, 4, 'T', '$'],
-                     [1, 'N', None, None], [1, 'A', None, None], [1, 'C', None, None], [1, 'G', None, None],
-                     [1, 'T', None, None], [1, '$', None, None]]
-
-        # 0 = left, 1 = right
-        self.codes = minidict({'N': [0, 0], 'A': [0, 1], 'C': [1, 0, 0],
-                               'G': [1, 0, 1], 'T': [1, 1, 0], '$': [1, 1, 1]})
+        # the same shifts as a flat lookup table indexed by character byte (for the jitted kernels)
+        self.f_lut = np.zeros(256, dtype=np.int64)
+        for (char, shift) in self.f.items():
+            if char is not None:
+                self.f_lut[ord(char)] = shift
+
+        # Packed bitvector of nodes, an array which stores the ranks of the bits
+        # with corresponding step size, and the length (in bits) of each bitvector
+        packed, self.bucket_bits, bucket_step_bits, self.bit_lens = self.create_bit_vecs(bwt)
+        self.bucket_step_bits = np.asarray(bucket_step_bits, dtype=np.int64)
+
+        # all node bitvectors concatenated into one contiguous buffer with every
+        # node's start rounded up to a 128-byte (cache line pair) boundary;
+        # bit_starts holds the byte offset of each node
+        self.bit_starts = np.zeros(len(packed), dtype=np.int64)
+        total = 0
+        for (node, p) in enumerate(packed):
+            total = -(-total // 128) * 128
+            self.bit_starts[node] = total
+            total += len(p)
+        self.packed_bits = np.zeros(total, dtype=np.uint8)
+        for (node, p) in enumerate(packed):
+            self.packed_bits[self.bit_starts[node]:(self.bit_starts[node] + len(p))] = p
+
+        # per-node views into the contiguous buffer
+        self.bits = [self.packed_bits[self.bit_starts[node]:(self.bit_starts[node] + len(p))]
+                     for (node, p) in enumerate(packed)]
+
+        # the bucket (rank) arrays of all nodes, colocated the same way so that a
+        # rank query touches one buffer for the bits and one for the buckets
+        self.bucket_starts = np.cumsum([0] + [len(bucket) for bucket in self.bucket_bits[:-1]], dtype=np.int64)
+        self.bucket_bits = np.concatenate([np.asarray(bucket, dtype=np.int32) for bucket in self.bucket_bits])
+
+        # the query-kernel buffers as one tuple, so the dispatchers below do
+        # a single attribute lookup per call
+        self._kernel_args = (self.packed_bits, self.bit_starts, self.bucket_bits,
+                             self.bucket_starts, self.bucket_step_bits)
 
         self.n = len(reference_genome)
 
@@ -104,11 +309,12 @@ class WaveletTree:
         Works only for DNA strings over the alphabet {A,C,G,N,T}.
         """
 
-        # `None` key is added later
-        shifts = {k: 0 for k in self.next_chars.keys()}
+        # count all characters in one C-level pass over the byte view of the string
+        buf = np.frombuffer(reference_genome.encode('ascii'), dtype=np.uint8)
+        counts = np.bincount(buf, minlength=256)
 
-        for i in range(len(reference_genome)):
-            shifts[reference_genome[i]] = shifts[reference_genome[i]] + 1
+        # `None` key is added later
+        shifts = {k: int(counts[ord(k)]) for k in self.next_chars.keys()}
 
         count_a = shifts['$']
         count_c = count_a + shifts['A']
@@ -127,10 +333,11 @@ class WaveletTree:
         return shifts
 
     def suffix_array(self, reference_genome: str, strategy: str,
-                     compression: int = 1) -> Tuple[List[int], frozenbitarray, List[int], str]:
+                     compression: int = 1) -> Tuple[np.ndarray, np.ndarray, np.ndarray, str]:
         """
-        Returns a compressed suffix array, a bit array which indicates the stored entries of the suffix array,
-        an array which stores the ranks of the bitarray with a given stepsize and the burrows wheeler transformation
+        Returns a compressed suffix array, a packed bitvector which indicates the stored entries
+        of the suffix array, an array which stores the ranks of the bitvector with a given stepsize
+        and the burrows wheeler transformation
         """
 
         suffix_array = []
@@ -139,28 +346,60 @@ class WaveletTree:
         elif strategy == 'ManberMyers':
             suffix_array = self.suffix_array_manbermyers(reference_genome)
         else:
-            suffix_array = self.suffix_array_kaerkkaeinensanders(reference_genome, len(reference_genome), 6)
+            try:
+                # compiled suffix array construction (libdivsufsort), orders of magnitude
+                # faster than the interpreted DC3 below on genome-sized inputs
+                import pydivsufsort
+                buf = np.frombuffer(reference_genome.encode('ascii'), dtype=np.uint8).copy()
+                suffix_array = pydivsufsort.divsufsort(buf)
+            except ImportError:
+                suffix_array = self.suffix_array_kaerkkaeinensanders(reference_genome, len(reference_genome), 6)
 
         code = self.get_bwt(reference_genome, suffix_array)
         if self.compression_sa == 1:
-            return suffix_array, None, None, code
+            return np.asarray(suffix_array, dtype=np.int32), None, None, code
         else:
-            suffix_compressed = []
-            bucket = [suffix_array[0] % compression == 0]
-            bits = []
-            rank = 0
-            for index, num in enumerate(suffix_array):
-                if num % compression == 0:
-                    bits.append(1)
-                    rank += 1
-                    suffix_compressed.append(num)
-                else:
-                    bits.append(0)
+            sa = np.asarray(suffix_array)
+            is_stored = (sa % compression == 0)
+            suffix_compressed = sa[is_stored].astype(np.int32)
+            bucket = self._build_bucket(is_stored, self.bucket_step_sa)
 
-                if index > 0 and index % self.bucket_step_sa == 0:
-                    bucket.append(rank)
+            return (suffix_compressed, np.packbits(is_stored), bucket, code)
 
-            return (suffix_compressed, frozenbitarray(bits), bucket, code)
+    def _build_bucket(self, bits, step: int) -> np.ndarray:
+        """
+        Returns the rank array of 'bits' sampled every 'step' positions
+        (entry j holds the number of set bits in bits[0 .. j*step])
+        """
+
+        cum = np.cumsum(np.asarray(bits, dtype=np.uint8), dtype=np.int64)
+        return cum[::step].astype(np.int32)
+
+    def _popcount_range(self, packed: np.ndarray, lo: int, hi: int) -> int:
+        """
+        Returns the number of set bits in positions [lo, hi] (inclusive)
+        of the bitvector given by its packed byte view
+        """
+
+        if hi < lo:
+            return 0
+
+        first = lo >> 3
+        last = hi >> 3
+
+        # mask away the bits before 'lo' / after 'hi' within their bytes
+        head_mask = 0xFF >> (lo & 7)
+        tail_mask = (0xFF << (7 - (hi & 7))) & 0xFF
+
+        if first == last:
+            return int(_POPCOUNT8[packed[first] & head_mask & tail_mask])
+
+        rank = int(_POPCOUNT8[packed[first] & head_mask]) + int(_POPCOUNT8[packed[last] & tail_mask])
+
+        if last - first > 1:
+            rank += int(_POPCOUNT8[packed[(first + 1):last]].sum())
+
+        return rank
 
     def suffix_array_kaerkkaeinensanders(self, reference_genome, n: int, k: int) -> List[int]:
         """
@@ -168,8 +407,8 @@ class WaveletTree:
         """
 
         def to_int(string: str) -> List[int]:
-            str_to_int = {'$': 1, 'A': 2, 'C': 3, 'G': 4, 'N': 5, 'T': 6}
-            return [str_to_int[char] for char in string]
+            # one table lookup over the byte view instead of a dict lookup per character
+            return _DC3_ENC[np.frombuffer(string.encode('ascii'), dtype=np.uint8)].tolist()
 
         def leq2(a1: int, a2: int, b1: int, b2: int) -> bool:
             return a1 < b1 or a1 == b1 and a2 <= b2
@@ -178,20 +417,11 @@ class WaveletTree:
             return a1 < b1 or a1 == b1 and leq2(a2, a3, b2, b3)
 
         def radix_pass(a: List[int], r: List[int], len_a: int, len_k: int) -> List[int]:
-            c = [0] * (len_k + 1)
-            b = [0] * len_a
-
-            for i in range(len_a):
-                c[r[a[i]]] += 1
-            sum = 0
-            for i in range(len_k + 1):
-                t = c[i]
-                c[i] = sum
-                sum += t
-            for i in range(len_a):
-                b[c[r[a[i]]]] = a[i]
-                c[r[a[i]]] += 1
-            return b
+            # stable counting sort of a[:len_a] by the key r[a[i]],
+            # expressed as NumPy's stable argsort on the key array
+            a = np.asarray(a[:len_a], dtype=np.int64)
+            keys = np.asarray(r, dtype=np.int64)[a]
+            return a[np.argsort(keys, kind='stable')].tolist()
 
         sa = [0] * n
         s = reference_genome
@@ -366,22 +596,47 @@ class WaveletTree:
     def suffix_array_simple(self, reference_genome):
         """
         Returns the suffix array
+
+        Reference implementation via prefix doubling on integer ranks
+        (np.lexsort), which avoids materializing all n suffix strings
         """
 
         n = len(reference_genome)
 
-        suffix_array = sorted([(reference_genome[i:], i) for i in range(n)])
+        buf = np.frombuffer(reference_genome.encode('ascii'), dtype=np.uint8)
+
+        # initial ranks are the characters themselves
+        ranks = buf.astype(np.int64)
+
+        k = 1
+        while True:
+            # rank of the suffix k positions further on (-1 past the end)
+            shifted = np.full(n, -1, dtype=np.int64)
+            shifted[:(n - k)] = ranks[k:]
+
+            order = np.lexsort((shifted, ranks))
+
+            # re-rank: increase whenever the (rank, shifted) key changes
+            changed = (ranks[order][1:] != ranks[order][:-1]) | (shifted[order][1:] != shifted[order][:-1])
+            new_ranks = np.empty(n, dtype=np.int64)
+            new_ranks[order] = np.concatenate(([0], np.cumsum(changed)))
+
+            ranks = new_ranks
 
-        offsets = [i[1] for i in suffix_array]
+            if ranks[order[-1]] == n - 1:
+                # all suffixes distinguished
+                return [int(i) for i in order]
 
-        return offsets
+            k *= 2
 
     def get_bwt(self, reference_genome: str, suffix_array: List[int] = None) -> str:
         """
         Returns the burrows wheeler transformation given a suffix array
         """
 
-        suffix_array = suffix_array or self.sa
+        # (`or` would attempt truth-testing a numpy array)
+        if suffix_array is None:
+            suffix_array = self.sa
 
         bw_transform = []
 
@@ -393,82 +648,68 @@ class WaveletTree:
 
         return ''.join(bw_transform)
 
-    def create_bit_vecs(self, lbwt: str) -> Tuple[List[frozenbitarray], List[List[int]], list]:
+    def create_bit_vecs(self, lbwt: str) -> Tuple[List[np.ndarray], List[np.ndarray], list, np.ndarray]:
         """
-        Returns the bitvectors of the wavelet tree, the rank arrays which store the ranks of the positive bits
-        of the bitvectors evenly spaced by a step size and the corresponding step size
+        Returns the packed bitvectors of the wavelet tree, the rank arrays which store the ranks
+        of the positive bits of the bitvectors evenly spaced by a step size, the corresponding
+        step size and the length (in bits) of each bitvector
         """
 
-        bit_vec0 = frozenbitarray([0 if char == 'N' or char == 'A' else 1 for char in lbwt])
+        # byte view of the bwt; all five bitmasks are computed with
+        # vectorized comparisons instead of per-character list comprehensions
+        b = np.frombuffer(lbwt.encode('ascii'), dtype=np.uint8)
 
-        bucket0_step = int(np.log2(len(bit_vec0)))
-        bucket0 = [bit_vec0[0]]
-        rank = 0
-        for index, num in enumerate(bit_vec0):
-            rank += num
-            if index > 0 and index % bucket0_step == 0:
-                bucket0.append(rank)
+        is_right = (b != ord('N')) & (b != ord('A'))
 
-        rbwt = [char for char in lbwt if char != 'N' and char != 'A']
-        lbwt = [char for char in lbwt if char == 'N' or char == 'A']
+        bucket0_step = int(np.log2(len(is_right)))
+        bucket0 = self._build_bucket(is_right, bucket0_step)
 
-        bit_vec1 = frozenbitarray([0 if char == 'N' else 1 for char in lbwt])
-        bit_vec2 = frozenbitarray([0 if char == 'C' or char == 'G' else 1 for char in rbwt])
+        rbwt = b[is_right]
+        lbwt = b[~is_right]
+
+        mask1 = (lbwt != ord('N'))
+        mask2 = (rbwt != ord('C')) & (rbwt != ord('G'))
 
         bucket1_step = 0
         bucket1 = []
-        if(len(bit_vec1) > 0):
-            bucket1_step = int(max(np.log2(len(bit_vec1)), 1))
-            bucket1 = [bit_vec1[0]]
-            rank = 0
-            for index, num in enumerate(bit_vec1):
-                rank += num
-                if index > 0 and index % bucket1_step == 0:
-                    bucket1.append(rank)
+        if(len(mask1) > 0):
+            bucket1_step = int(max(np.log2(len(mask1)), 1))
+            bucket1 = self._build_bucket(mask1, bucket1_step)
 
         bucket2_step = 0
         bucket2 = []
-        if(len(bit_vec2) > 0):
-            bucket2_step = int(max(np.log2(len(bit_vec2)), 1))
-            bucket2 = [bit_vec2[0]]
-            rank = 0
-            for index, num in enumerate(bit_vec2):
-                rank += num
-                if index > 0 and index % bucket2_step == 0:
-                    bucket2.append(rank)
+        if(len(mask2) > 0):
+            bucket2_step = int(max(np.log2(len(mask2)), 1))
+            bucket2 = self._build_bucket(mask2, bucket2_step)
 
-        lbwt = [char for char in rbwt if char == 'C' or char == 'G']
-        rbwt = [char for char in rbwt if char == 'T' or char == '$']
+        # C/G go left at node 2, i.e. exactly the zero bits of mask2
+        is_cg = ~mask2
+        lbwt = rbwt[is_cg]
+        rbwt = rbwt[~is_cg]
 
-        bit_vec3 = frozenbitarray([0 if char == 'C' else 1 for char in lbwt])
-        bit_vec4 = frozenbitarray([0 if char == 'T' else 1 for char in rbwt])
+        mask3 = (lbwt != ord('C'))
+        mask4 = (rbwt != ord('T'))
 
         bucket3_step = 0
         bucket3 = []
 
-        if(len(bit_vec3) > 0):
-            bucket3_step = int(max(np.log2(len(bit_vec3)), 1))
-            bucket3 = [bit_vec3[0]]
-            rank = 0
-            for index, num in enumerate(bit_vec3):
-                rank += num
-                if index > 0 and index % bucket3_step == 0:
-                    bucket3.append(rank)
+        if(len(mask3) > 0):
+            bucket3_step = int(max(np.log2(len(mask3)), 1))
+            bucket3 = self._build_bucket(mask3, bucket3_step)
 
         bucket4_step = 0
         bucket4 = []
 
-        if(len(bit_vec4)):
-            bucket4_step = int(max(np.log2(len(bit_vec4)), 1))
-            bucket4 = [bit_vec4[0]]
-            rank = 0
-            for index, num in enumerate(bit_vec4):
-                rank += num
-                if index > 0 and index % bucket4_step == 0:
-                    bucket4.append(rank)
+        if(len(mask4)):
+            bucket4_step = int(max(np.log2(len(mask4)), 1))
+            bucket4 = self._build_bucket(mask4, bucket4_step)
+
+        masks = [is_right, mask1, mask2, mask3, mask4]
 
-        return [bit_vec0, bit_vec1, bit_vec2, bit_vec3, bit_vec4], [bucket0, bucket1, bucket2, bucket3, bucket4], \
-               [bucket0_step, bucket1_step, bucket2_step, bucket3_step, bucket4_step]
+        return [np.packbits(mask) for mask in masks], \
+               [bucket0, bucket1, bucket2, bucket3, bucket4], \
+               [bucket0_step, bucket1_step, bucket2_step, bucket3_step, bucket4_step], \
+               np.array([len(mask) for mask in masks], dtype=np.int64)
 
     def __len__(self):
         """
@@ -484,22 +725,25 @@ class WaveletTree:
 
         n = self.n - 1
 
-        next_char = self.access(0)
-        next_row = 0
-        original = next_char
+        access = self.access
+        rank = self.rank
+        f = self.f
 
-        rank = 0
+        # fill a preallocated byte buffer from the right instead of
+        # prepending to a string (which would copy the string each step)
+        original = bytearray(n)
 
-        for i in range(n - 1):
-            rank = self.rank(next_char, next_row)
+        next_char = access(0)
+        next_row = 0
+        original[n - 1] = ord(next_char)
 
-            skip = self.f[next_char]
-            next_row = rank + skip - 1
+        for pos in range(n - 2, -1, -1):
+            next_row = rank(next_char, next_row) + f[next_char] - 1
 
-            next_char = self.access(next_row)
-            original = next_char + original
+            next_char = access(next_row)
+            original[pos] = ord(next_char)
 
-        return original
+        return original.decode('ascii')
 
     def __sizeof__(self):
         """
@@ -517,8 +761,6 @@ class WaveletTree:
             print("F:\t\t\t\t\t ", get_deep_size(self.f))
             print("bitvec:\t\t\t\t ", get_deep_size(self.bitvector))
             print("bits:\t\t\t\t ", get_deep_size(self.bits))
-            print("meta:\t\t\t\t ", get_deep_size(self.meta))
-            print("codes:\t\t\t\t ", get_deep_size(self.codes))
             print("n:\t\t\t\t\t ", get_deep_size(self.n))
             print("bucket_bits:\t\t\t\t\t ", get_deep_size(self.bucket_bits))
             print("bucket_step_bits:\t\t\t ", get_deep_size(self.bucket_step_bits))
@@ -526,7 +768,7 @@ class WaveletTree:
             total = get_deep_size(self.compression_sa) + \
                     get_deep_size(self.next_chars) + get_deep_size(self.sa) + \
                     get_deep_size(self.f) + get_deep_size(self.bitvector) + get_deep_size(self.bits) + \
-                    get_deep_size(self.meta) + get_deep_size(self.codes) + get_deep_size(self.n) + \
+                    get_deep_size(self.n) + \
                     get_deep_size(self.bucket_step_sa) + get_deep_size(self.bucket_sa) + \
                     get_deep_size(self.bucket_bits) + get_deep_size(self.bucket_step_bits)
 
@@ -545,10 +787,8 @@ class WaveletTree:
         if self.compression_sa == 0:
             return index + 1
 
-        rank = 0
         bucket_index = int(index / self.bucket_step_sa)
-        for i in range(bucket_index * self.bucket_step_sa + 1, index + 1):
-            rank += self.bitvector[i]
+        rank = self._popcount_range(self.bitvector, bucket_index * self.bucket_step_sa + 1, index)
 
         return self.bucket_sa[bucket_index] + rank
 
@@ -558,97 +798,31 @@ class WaveletTree:
         """
 
         if self.compression_sa == 1:
-            return self.sa[index]
-        if self.bitvector[index] == 1:
-            return self.sa[self.rank_bit(index) - 1]
+            return int(self.sa[index])
+        if _get_bit(self.bitvector, index) == 1:
+            return int(self.sa[self.rank_bit(index) - 1])
         else:
+            (next_row, counter) = _sa_walk_kernel(*self._kernel_args, self.bitvector, self.f_lut, index)
 
-            n = self.n - 1
-
-            next_char = self.access(index)
-            next_row = index
-
-            rank = 0
-            counter = 0
-            while self.bitvector[next_row] != 1:
-                rank = self.rank(next_char, next_row)
-
-                skip = self.f[next_char]
-                next_row = rank + skip - 1
-                next_char = self.access(next_row)
-
-                counter += 1
-
-            return self.sa[self.rank_bit(next_row) - 1] + counter
+            return int(self.sa[self.rank_bit(next_row) - 1]) + counter
 
     def rank(self, char: str, index: int):
         """
         Returns the rank of the char up to the index [0,index]
         """
 
-        codes = self.codes[char]
-        curr_node = 0
-        curr_index = index
-        rank = 0
-
-        for code in codes:
-
-            rank = self.rank_bit_node(curr_index, curr_node)
-
-            if self.bits[curr_node][curr_index] != code:
-                rank = curr_index - rank + 1
-
-            if rank == 0:
-                return 0
-
-            curr_index = rank - 1
-
-            curr_node = self.meta[curr_node][2 + code]
-
-        return rank
+        return int(_rank_kernel(*self._kernel_args, _CHAR_ROW[ord(char)], index))
 
     def rank_bit_node(self, index: int, node: int = 0) -> int:
         """
         Returns the rank of the bit up to the index [0,index] at the given node
         """
 
-        rank = 0
-        bucket_index = int(index / self.bucket_step_bits[node])
-        for i in range(bucket_index * self.bucket_step_bits[node] + 1, index + 1):
-            rank += self.bits[node][i]  # self.bitvector[i]
-
-        rank += self.bucket_bits[node][bucket_index]
-
-        if self.bits[node][index] == 1:
-            return rank
-        else:
-            return index + 1 - rank
+        return int(_rank_bit_node_kernel(*self._kernel_args, index, node))
 
     def access(self, index: int, node: int = 0) -> str:
         """
         Returns the character of the burrows wheeler transformation at the given index
         """
 
-        curr_node = node
-
-        # leaf node
-        if self.meta[curr_node][2] is None:
-            return self.meta[curr_node][1]
-
-        # parent of a leaf
-        if type(self.meta[curr_node][2]) is str:
-            return self.meta[curr_node][2]
-
-        bit = self.bits[curr_node][index]
-        curr_index = index
-
-        while type(self.meta[curr_node][2]) is not str:
-
-            par_node = curr_node
-
-            curr_node = self.meta[curr_node][2 + bit]
-
-            curr_index = self.rank_bit_node(curr_index, par_node) - 1
-            bit = self.bits[curr_node][curr_index]
-
-        return self.meta[curr_node][2+bit]
+        return chr(_access_kernel(*self._kernel_args, index, node))
@@ -16,6 +16,9 @@ import re
 
 # https://learn.gencore.bio.nyu.edu/alignment/
 
+# compiled once instead of per record
+_CIGAR_RE = re.compile(rb"([0-9]+)([XIDSM=])")
+
 
 def coverage_pbp(file, reference_length=None) -> np.ndarray:
     """
@@ -29,22 +32,38 @@ def coverage_pbp(file, reference_length=None) -> np.ndarray:
     if it is not specified.
     """
 
-    from humdum.io import from_sam
-
-    zeros = (lambda n: np.zeros(n, dtype=int))
-    counts = zeros(reference_length or 0)
-    for read in from_sam(file):
-        a = read.pos
-        for (n, A) in re.findall(r"([0-9]+)([XIDSM=])", read.cigar):
-            b = a + int(n)
-            assert (a < b), "Only expect positive numbers in CIGAR."
-            if (A in '=M'):
-                if (b > len(counts)):
-                    counts = np.concatenate([counts, zeros(b - len(counts))])
-                counts[a:b] += 1
-            a = b
-
-    return counts
+    from humdum.io import open_maybe_gz
+
+    # collect the aligned blocks of all reads as (start, end) intervals;
+    # only POS and CIGAR are needed, so parse the raw bytes directly
+    # instead of building an AlignedSegment per record (`from_sam`)
+    starts = []
+    ends = []
+    with open_maybe_gz(file, mode='rb') as fd:
+        for line in fd:
+            if line.startswith(b'@'):
+                continue
+            cols = line.split(b'\t', 6)
+            a = int(cols[3])
+            for (n, A) in _CIGAR_RE.findall(cols[5]):
+                b = a + int(n)
+                assert (a < b), "Only expect positive numbers in CIGAR."
+                if (A in b'=M'):
+                    starts.append(a)
+                    ends.append(b)
+                a = b
+
+    length = reference_length or 0
+    if ends:
+        length = max(length, max(ends))
+
+    # difference-array trick: +1 at each interval start, -1 past each
+    # interval end, then a cumulative sum yields the per-base coverage
+    diff = np.zeros(length + 1, dtype=int)
+    np.add.at(diff, np.asarray(starts, dtype=int), 1)
+    np.add.at(diff, np.asarray(ends, dtype=int), -1)
+
+    return np.cumsum(diff[:-1])
 
 
 def test_coverage_pbp(file):
@@ -107,7 +107,7 @@ class TestIndex(TestCase):
 
         self.assertIsInstance(fm_index2, GenomeIndex)
 
-        self.assertEqual(fm_index.bwt.sa, fm_index2.bwt.sa)
+        self.assertEqual(list(fm_index.bwt.sa), list(fm_index2.bwt.sa))
         self.assertEqual(str(fm_index), str(fm_index2))
         self.assertEqual(fm_index.bwt.f, fm_index2.bwt.f)
         self.assertEqual(fm_index.bwt.next_chars._data, fm_index2.bwt.next_chars._data)
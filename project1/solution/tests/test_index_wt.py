@@ -1,6 +1,8 @@
 
 from unittest import TestCase
 
+import numpy as np
+
 # Note: there could be an issue with multiple TestCase classes per file [RA]
 from humdum.index.wt import WaveletTree
 from humdum.index.bw import BurrowsWheeler
@@ -29,7 +31,8 @@ class TestIndexBW(TestCase):
         encoded = WaveletTree("ACGTGTAC").get_bwt("ACGTGTAC")
 
         self.assertIsInstance(encoded, str)
-        self.assertIsInstance(suffix, list)
+        self.assertIsInstance(suffix, np.ndarray)
+        self.assertEqual(suffix.dtype, np.int32)
 
         string = "ACGATCGATCAGTAC"
         self.assertEqual(len(string), len(WaveletTree(string)))
@@ -115,9 +115,11 @@ class Classifier:
             monitor='val_precision', min_delta=0, patience=args.early_stopping_patience, verbose=1, mode='max',
             baseline=None, restore_best_weights=True)
 
-        history = phenomenet.fit(train_data, train_labels, validation_data=(
-            eval_data, eval_labels),
-                                 batch_size=args.batch_size, verbose=2,
+        # feed via tf.data so host-to-device copies overlap with compute
+        train_ds = Phenomenet.make_dataset(train_data, train_labels, args.batch_size)
+        eval_ds = Phenomenet.make_dataset(eval_data, eval_labels, args.batch_size)
+
+        history = phenomenet.fit(train_ds, validation_data=eval_ds, verbose=2,
                                  epochs=args.epochs, class_weight=weights, callbacks=[cb])
 
         return history, phenomenet
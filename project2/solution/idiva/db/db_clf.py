@@ -3,33 +3,161 @@
 import idiva.io
 from idiva import log
 import typing
+import numpy as np
 import pandas as pd
 
+from functools import lru_cache
+
+
+@lru_cache(maxsize=32)
+def _cached_db(chrom: int) -> pd.DataFrame:
+    """
+    Loads the db label table for the chromosome and downcasts it once:
+    positions fit in int32, the REF/ALT strings take few distinct values
+    each, and the class label is a small int (nullable, as the db may
+    lack a label). Repeated pipeline invocations reuse the parsed frame,
+    so it must not be mutated by the callers.
+    """
+    from idiva.db import db
+
+    df = db.get_db_label_df(which_dbSNP=chrom)
+
+    # only these columns take part in the label lookup
+    df = df[['pos', 'ref', 'alt', 'class']]
+
+    df = df.astype({'pos': 'int32', 'ref': 'category', 'alt': 'category'}, copy=False)
+    df['class'] = df['class'].astype('Int8')
+
+    return df
+
+
+# byte value -> base code for the single-base fast path below
+_BASE_LUT = np.full(256, 255, dtype=np.uint8)
+for (_i, _base) in enumerate('ACGTN'):
+    _BASE_LUT[ord(_base)] = _i
+
+
+def _single_base_codes(ser: pd.Series) -> typing.Optional[np.ndarray]:
+    """
+    Returns the 0..4 code of every entry of an all-single-base column,
+    obtained by viewing the column as fixed-width bytes (no per-row
+    Python dispatch), or None if any entry is not one of A/C/G/T/N
+    (e.g. an indel).
+    """
+
+    values = ser.astype(str)
+
+    if not values.str.len().eq(1).all():
+        return None
+
+    codes = _BASE_LUT[values.to_numpy(dtype='S1').view(np.uint8)]
+
+    if (codes == 255).any():
+        return None
+
+    return codes
+
+
+def _encode_keys(case_control: pd.DataFrame, db_PosRefAlt: pd.DataFrame) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """
+    Encodes (POS, REF, ALT) of both dataframes into one int64 per row:
+    the position in the high bits and the code of the (REF, ALT) pair in
+    the low bits. Merging on this single column avoids per-row tuple
+    hashing of the three object columns.
+    Pure-SNV columns take the byte-view fast path; otherwise the string
+    pairs are factorized jointly over both frames (exact, unlike a
+    truncated hash, so indels are handled too).
+    """
+
+    case_pos = case_control['POS'].to_numpy(dtype=np.int64)
+    db_pos = db_PosRefAlt['pos'].to_numpy(dtype=np.int64)
+
+    ra_codes = [_single_base_codes(ser) for ser in (case_control['REF'], case_control['ALT'],
+                                                    db_PosRefAlt['ref'], db_PosRefAlt['alt'])]
+
+    if not any(codes is None for codes in ra_codes):
+        (case_ref, case_alt, db_ref, db_alt) = ra_codes
+
+        case_key = (case_pos << 6) | (case_ref.astype(np.int64) << 3) | case_alt
+        db_key = (db_pos << 6) | (db_ref.astype(np.int64) << 3) | db_alt
+
+        return (case_key, db_key)
+
+    case_ra = case_control['REF'].astype(str) + ':' + case_control['ALT'].astype(str)
+    db_ra = db_PosRefAlt['ref'].astype(str) + ':' + db_PosRefAlt['alt'].astype(str)
+
+    (codes, uniques) = pd.factorize(pd.concat([case_ra, db_ra], ignore_index=True))
+
+    # bits needed for the (REF, ALT) code; position fits in the remaining ones
+    shift = max(int(len(uniques)).bit_length(), 1)
+
+    case_key = (case_pos << shift) | codes[:len(case_ra)]
+    db_key = (db_pos << shift) | codes[len(case_ra):]
+
+    return (case_key, db_key)
+
 
 def db_classifier(*, case: idiva.io.ReadVCF, ctrl: idiva.io.ReadVCF) -> object:
     """
     Classifies the case-control df by querying the clinvar and dbSNP data.
     """
     from idiva.clf.df import c5_df
-    from idiva.db import db
 
     log.info("Running the database classifier.")
 
     log.info('Retrieving case df.')
-    case_control = c5_df(case)
+    # project to the emitted columns up front, in case c5_df ever grows more
+    case_control = c5_df(case)[['CHROM', 'POS', 'ID', 'REF', 'ALT']]
+
+    # the prepared db frame is shared across calls (see _cached_db)
+    db_PosRefAlt = _cached_db(int(case_control.iloc[0]['CHROM']))
+
+    # shrink the case frame too, aligning its REF/ALT categories with the
+    # db ones so equal strings carry equal codes
+    from pandas.api.types import union_categoricals
+
+    case_control = case_control.astype({'POS': 'int32', 'REF': 'category', 'ALT': 'category'}, copy=False)
+    for (a, b) in (('REF', 'ref'), ('ALT', 'alt')):
+        categories = union_categoricals([case_control[a], db_PosRefAlt[b]]).categories
+        case_control[a] = case_control[a].cat.set_categories(categories)
+
+    # with pyarrow available, keep the ID strings in one contiguous UTF-8
+    # buffer instead of boxed Python objects (the other columns are already
+    # numeric or categorical, and the join key itself is int64)
+    try:
+        import pyarrow  # noqa: F401 -- only probing for availability
+        case_control['ID'] = case_control['ID'].astype('string[pyarrow]')
+    except ImportError:
+        pass
+
+    (case_key, db_key) = _encode_keys(case_control, db_PosRefAlt)
+
+    # sort-merge lookup: sort the db keys once, then attaching the label is
+    # one binary-search pass with sequential gathers -- cache-friendlier
+    # than probing a hashtable of the whole-chromosome key set
+    order = np.argsort(db_key, kind='stable')
+    db_key = db_key[order]
+    db_class = db_PosRefAlt['class'].to_numpy(dtype=np.int8, na_value=2)[order]
+
+    if len(db_key):
+        idx = np.minimum(np.searchsorted(db_key, case_key), len(db_key) - 1)
+        found = (db_key[idx] == case_key)
+        # filling all missing values with 2, for "unknown"
+        labels = np.where(found, db_class[idx], np.int8(2)).astype(np.int8)
+    else:
+        found = np.zeros(len(case_key), dtype=bool)
+        labels = np.full(len(case_key), 2, dtype=np.int8)
 
-    from idiva.clf.df import apply_dtype
-    db_PosRefAlt = db.get_db_label_df(which_dbSNP=int(case_control.iloc[0]['CHROM']))
+    log.info(f"Found {int(found.sum())} labels in databases.")
 
-    merge_on_PosRefAlt = case_control.merge(db_PosRefAlt, left_on=['POS', 'REF', 'ALT'], right_on=['pos', 'ref', 'alt'],
-                                            how='left')
-    # filling all missing values with 2, for "unknown"
-    merge_on_PosRefAlt['class'] = merge_on_PosRefAlt['class'].fillna(2)
-    log.info(
-        f"Found {len(merge_on_PosRefAlt) - merge_on_PosRefAlt.loc[merge_on_PosRefAlt['class'] == 2, 'class'].count()} "
-        f"labels in databases.")
+    # model the label as an ordered categorical backed by the int8 codes
+    # (no float64 promotion as with a numeric fillna); the VCF INFO field
+    # is declared Integer, so the emitted column carries the codes
+    case_control['class'] = pd.Categorical.from_codes(
+        labels, categories=['Benign', 'Pathogenic', 'Unknown'], ordered=True)
 
-    result = merge_on_PosRefAlt[['CHROM', 'POS', 'ID', 'REF', 'ALT', 'class']]
+    result = case_control[['CHROM', 'POS', 'ID', 'REF', 'ALT']].assign(
+        **{'class': case_control['class'].cat.codes})
 
     class response:
         id_cols = ['CHROM', 'POS', 'ID', 'REF', 'ALT']